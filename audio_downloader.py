@@ -1,240 +1,416 @@
-import asyncio
-import os
-import tempfile
-import logging
-import yt_dlp
-from config import YTDL_OPTIONS
-import discord
-import threading
-import time
-
-logger = logging.getLogger(__name__)
-
-class DownloadedAudioSource(discord.AudioSource):
-    """
-    Audio source that plays from a downloaded temporary file
-    """
-    
-    def __init__(self, filepath, cleanup_func=None):
-        self.filepath = filepath
-        self.cleanup_func = cleanup_func
-        
-        # Create FFmpeg source for the downloaded file
-        self.source = discord.FFmpegPCMAudio(
-            filepath,
-            before_options='-nostdin',
-            options='-vn'
-        )
-        
-    def read(self):
-        return self.source.read()
-    
-    def is_opus(self):
-        return self.source.is_opus()
-    
-    def cleanup(self):
-        if hasattr(self.source, 'cleanup'):
-            self.source.cleanup()
-        
-        if self.cleanup_func:
-            self.cleanup_func()
-
-class AudioDownloader:
-    """
-    Downloads audio from YouTube URLs and provides audio sources for discord.py
-    """
-    
-    def __init__(self):
-        self.temp_dir = tempfile.mkdtemp(prefix="discord_music_")
-        self.active_downloads = {}
-        self.cleanup_tasks = []
-        
-        # Configure yt-dlp for downloading (override skip_download)
-        self.ytdl_options = YTDL_OPTIONS.copy()
-        self.ytdl_options.update({
-            'format': 'bestaudio[ext=m4a]/bestaudio/best',
-            'outtmpl': os.path.join(self.temp_dir, '%(id)s.%(ext)s'),
-            'quiet': True,
-            'no_warnings': True,
-            'skip_download': False,  # Enable downloading
-            'extract_flat': False,   # Don't extract flat
-        })
-        
-        # Remove any options that prevent downloading
-        if 'skip_download' in self.ytdl_options:
-            del self.ytdl_options['skip_download']
-        
-        logger.info(f"AudioDownloader initialized with temp directory: {self.temp_dir}")
-    
-    async def download_audio(self, url, timeout=60):
-        """
-        Download audio from YouTube URL and return the file path
-        
-        Args:
-            url: YouTube URL
-            timeout: Download timeout in seconds
-            
-        Returns:
-            str: Path to downloaded audio file
-        """
-        try:
-            # Check if already downloading
-            if url in self.active_downloads:
-                logger.info(f"Download already in progress for {url}, waiting...")
-                future = self.active_downloads[url]
-                return await future
-            
-            # Create future for this download
-            future = asyncio.Future()
-            self.active_downloads[url] = future
-            
-            try:
-                # Run yt-dlp download in thread pool
-                loop = asyncio.get_event_loop()
-                filepath = await asyncio.wait_for(
-                    loop.run_in_executor(None, self._download_sync, url),
-                    timeout=timeout
-                )
-                
-                if filepath and os.path.exists(filepath):
-                    logger.info(f"Successfully downloaded audio to: {filepath}")
-                    future.set_result(filepath)
-                    return filepath
-                else:
-                    error_msg = "Download completed but file not found"
-                    logger.error(error_msg)
-                    future.set_exception(Exception(error_msg))
-                    return None
-                    
-            except asyncio.TimeoutError:
-                error_msg = f"Download timed out after {timeout} seconds"
-                logger.error(error_msg)
-                future.set_exception(Exception(error_msg))
-                return None
-            except Exception as e:
-                logger.error(f"Download error: {e}")
-                future.set_exception(e)
-                return None
-            finally:
-                # Remove from active downloads
-                if url in self.active_downloads:
-                    del self.active_downloads[url]
-                    
-        except Exception as e:
-            logger.error(f"Error in download_audio: {e}")
-            return None
-    
-    def _download_sync(self, url):
-        """
-        Synchronous download function to run in thread pool
-        """
-        try:
-            # List files before download
-            files_before = set(os.listdir(self.temp_dir)) if os.path.exists(self.temp_dir) else set()
-            
-            with yt_dlp.YoutubeDL(self.ytdl_options) as ytdl:
-                # Extract info first
-                info = ytdl.extract_info(url, download=False)
-                if not info:
-                    raise Exception("Could not extract video info")
-                
-                video_id = info.get('id', 'unknown')
-                title = info.get('title', 'Unknown')
-                
-                logger.info(f"Downloading: {title} (ID: {video_id})")
-                
-                # Download the audio
-                ytdl.download([url])
-                
-                # List files after download
-                files_after = set(os.listdir(self.temp_dir))
-                new_files = files_after - files_before
-                
-                if new_files:
-                    # Found new file(s)
-                    filename = list(new_files)[0]  # Take the first new file
-                    filepath = os.path.join(self.temp_dir, filename)
-                    logger.info(f"Found downloaded file: {filepath}")
-                    
-                    # Verify file exists and has content
-                    if os.path.exists(filepath) and os.path.getsize(filepath) > 0:
-                        return filepath
-                    else:
-                        raise Exception(f"Downloaded file exists but is empty: {filepath}")
-                else:
-                    # Try to find by video ID (fallback)
-                    for filename in os.listdir(self.temp_dir):
-                        if video_id in filename:
-                            filepath = os.path.join(self.temp_dir, filename)
-                            logger.info(f"Found file by video ID: {filepath}")
-                            return filepath
-                    
-                    # List all files for debugging
-                    all_files = os.listdir(self.temp_dir)
-                    logger.error(f"No new files found. Current files in temp dir: {all_files}")
-                    raise Exception(f"Downloaded file not found for video ID: {video_id}")
-                
-        except Exception as e:
-            logger.error(f"Sync download error: {e}")
-            raise
-    
-    async def create_audio_source(self, url, volume=1.0):
-        """
-        Create an audio source for the given URL
-        
-        Args:
-            url: YouTube URL
-            volume: Audio volume (0.0 to 1.0)
-            
-        Returns:
-            AudioSource: Discord audio source
-        """
-        try:
-            filepath = await self.download_audio(url)
-            if not filepath:
-                raise Exception("Failed to download audio")
-            
-            # Create cleanup function
-            def cleanup_file():
-                try:
-                    if os.path.exists(filepath):
-                        os.remove(filepath)
-                        logger.info(f"Cleaned up temporary file: {filepath}")
-                except Exception as e:
-                    logger.error(f"Error cleaning up file {filepath}: {e}")
-            
-            # Schedule cleanup after some time (in case of errors)
-            def schedule_cleanup():
-                time.sleep(300)  # 5 minutes
-                cleanup_file()
-            
-            cleanup_thread = threading.Thread(target=schedule_cleanup, daemon=True)
-            cleanup_thread.start()
-            
-            # Create audio source
-            source = DownloadedAudioSource(filepath, cleanup_file)
-            
-            # Apply volume if needed
-            if volume != 1.0:
-                source = discord.PCMVolumeTransformer(source, volume=volume)
-            
-            return source
-            
-        except Exception as e:
-            logger.error(f"Error creating audio source: {e}")
-            raise
-    
-    def cleanup(self):
-        """
-        Clean up temporary directory and files
-        """
-        try:
-            import shutil
-            if os.path.exists(self.temp_dir):
-                shutil.rmtree(self.temp_dir)
-                logger.info(f"Cleaned up temp directory: {self.temp_dir}")
-        except Exception as e:
-            logger.error(f"Error cleaning up temp directory: {e}")
-
-# Global instance
-audio_downloader = AudioDownloader()
+import asyncio
+import atexit
+import functools
+import os
+import tempfile
+import logging
+import yt_dlp
+from diskcache import Cache
+from config import YTDL_OPTIONS
+import discord
+import heapq
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs
+
+# How long cached metadata/filepaths stay valid (seconds)
+METADATA_CACHE_TTL = 86400
+
+# How long evicted files stay on disk before cleanup (seconds)
+FILE_CLEANUP_DELAY = 300
+
+# Maximum total size of cached audio files on disk (bytes)
+FILE_CACHE_LIMIT = 2 * 1024 ** 3
+
+# Safety margin before a direct URL's stated expiry (seconds)
+URL_EXPIRY_MARGIN = 60
+
+logger = logging.getLogger(__name__)
+
+def _direct_url_expired(direct_url):
+    """
+    Check whether a direct audio URL has passed its expiry
+
+    googlevideo URLs carry a unix timestamp in their 'expire' query param
+    and start returning 403 after roughly six hours — well inside the
+    24 h metadata TTL. A URL without the param is treated as still valid.
+    """
+    try:
+        expire = parse_qs(urlparse(direct_url).query).get('expire')
+        if expire:
+            return time.time() >= int(expire[0]) - URL_EXPIRY_MARGIN
+    except (ValueError, TypeError):
+        pass
+    return False
+
+class DownloadedAudioSource(discord.AudioSource):
+    """
+    Audio source that plays from a downloaded temporary file
+    """
+    
+    def __init__(self, filepath, cleanup_func=None, opus=True, volume=1.0):
+        self.filepath = filepath
+        self.cleanup_func = cleanup_func
+
+        if opus:
+            # Let ffmpeg emit Opus directly so discord.py can pass frames
+            # through without a PCM decode/re-encode round-trip; volume is
+            # applied by ffmpeg's filter so non-unit volume doesn't force
+            # the PCM path
+            options = '-vn -c:a libopus -b:a 96k -vbr on'
+            if volume != 1.0:
+                options += f' -af volume={volume}'
+            self.source = discord.FFmpegOpusAudio(
+                filepath,
+                before_options='-nostdin -probesize 32 -analyzeduration 0 -fflags nobuffer -flags low_delay',
+                options=options
+            )
+        else:
+            # PCM path, needed when a volume transformer will wrap us
+            self.source = discord.FFmpegPCMAudio(
+                filepath,
+                before_options='-nostdin -probesize 32 -analyzeduration 0 -fflags nobuffer -flags low_delay',
+                options='-vn'
+            )
+
+    def read(self):
+        return self.source.read()
+    
+    def is_opus(self):
+        return self.source.is_opus()
+    
+    def cleanup(self):
+        if hasattr(self.source, 'cleanup'):
+            self.source.cleanup()
+        
+        if self.cleanup_func:
+            self.cleanup_func()
+
+class AudioDownloader:
+    """
+    Downloads audio from YouTube URLs and provides audio sources for discord.py
+    """
+    
+    def __init__(self):
+        self.temp_dir = tempfile.mkdtemp(prefix="discord_music_")
+        self.url_locks = {}
+
+        # LRU of url -> filepath so repeat plays reuse the downloaded file
+        self.file_cache = OrderedDict()
+        self.cache_bytes = 0
+        self.cache_limit = FILE_CACHE_LIMIT
+
+        # Single cleanup task working off a heap of (deadline, filepath)
+        # instead of one sleeping thread per downloaded file
+        self._cleanup_heap = []
+        self._cleanup_event = asyncio.Event()
+        self._cleanup_task = None
+
+        # On-disk cache for extracted metadata and resolved file paths so
+        # repeat requests skip the extractor round-trip entirely
+        self.meta_cache = Cache(os.path.join(self.temp_dir, 'meta'))
+
+        # Bounded executor so a burst of /play commands can't fan out into
+        # dozens of concurrent yt-dlp calls and trip YouTube rate limits
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='ytdl')
+        
+        # Configure yt-dlp for downloading (override skip_download)
+        self.ytdl_options = YTDL_OPTIONS.copy()
+        self.ytdl_options.update({
+            'format': 'bestaudio[ext=m4a]/bestaudio/best',
+            'outtmpl': os.path.join(self.temp_dir, '%(id)s.%(ext)s'),
+            'quiet': True,
+            'no_warnings': True,
+            'skip_download': False,  # Enable downloading
+            'extract_flat': False,   # Don't extract flat
+        })
+        
+        # Remove any options that prevent downloading
+        if 'skip_download' in self.ytdl_options:
+            del self.ytdl_options['skip_download']
+
+        # One YoutubeDL for the downloader's lifetime: re-constructing it per
+        # call re-initializes every extractor and throws away yt-dlp's
+        # in-process player-JS cache. The instance is not thread-safe, so
+        # all calls on it are serialized by a lock.
+        self._ytdl = yt_dlp.YoutubeDL(self.ytdl_options)
+        self._ytdl.add_progress_hook(self._progress_hook)
+        self._ytdl_lock = threading.Lock()
+        self._download_result = {}
+
+        logger.info("AudioDownloader initialized with temp directory: %s", self.temp_dir)
+    
+    async def download_audio(self, url, timeout=60):
+        """
+        Download audio from YouTube URL and return the file path
+        
+        Args:
+            url: YouTube URL
+            timeout: Download timeout in seconds
+            
+        Returns:
+            str: Path to downloaded audio file
+        """
+        # Coalesce concurrent requests for the same URL into one download
+        lock = self.url_locks.setdefault(url, asyncio.Lock())
+
+        try:
+            return await self._download_audio_locked(url, lock, timeout)
+        finally:
+            # Drop the entry once the lock is free and nobody is queued on
+            # it; otherwise this dict grows one dead lock per unique URL
+            # for the life of the process
+            if not lock.locked() and not lock._waiters:
+                self.url_locks.pop(url, None)
+
+    async def _download_audio_locked(self, url, lock, timeout):
+        async with lock:
+            # Serve repeat plays straight from the file cache
+            # (stat calls go through a thread so the event loop never blocks)
+            cached = self.file_cache.get(url)
+            if cached and await asyncio.to_thread(os.path.exists, cached):
+                self.file_cache.move_to_end(url)
+                logger.info("Reusing downloaded file for %s: %s", url, cached)
+                return cached
+
+            try:
+                # Run yt-dlp download in thread pool
+                loop = asyncio.get_event_loop()
+                filepath = await asyncio.wait_for(
+                    loop.run_in_executor(self.executor, self._download_sync, url),
+                    timeout=timeout
+                )
+
+                if filepath and await asyncio.to_thread(os.path.exists, filepath):
+                    logger.info("Successfully downloaded audio to: %s", filepath)
+                    self._cache_file(url, filepath)
+                    return filepath
+                else:
+                    logger.error("Download completed but file not found")
+                    return None
+
+            except asyncio.TimeoutError:
+                logger.error("Download timed out after %s seconds", timeout)
+                return None
+            except Exception as e:
+                logger.error("Download error: %s", e)
+                return None
+    
+    def _extract_info(self, url):
+        """
+        Extract video metadata, using the on-disk cache to avoid re-hitting
+        YouTube for URLs we have seen recently
+        """
+        cached = self.meta_cache.get(url)
+        if cached:
+            # The direct URL expires long before the metadata TTL; a stale
+            # one doesn't fail until ffmpeg hits the 403 mid-playback, so
+            # check it here and re-extract instead of streaming it
+            direct = cached.get('url')
+            if direct and _direct_url_expired(direct):
+                logger.info("Cached direct URL expired for %s, re-extracting", url)
+                self.meta_cache.delete(url)
+            else:
+                logger.info("Using cached metadata for %s", url)
+                return cached
+
+        with self._ytdl_lock:
+            info = self._ytdl.extract_info(url, download=False)
+
+        if not info:
+            raise Exception("Could not extract video info")
+
+        # Only keep the JSON-safe fields we actually use
+        meta = {
+            'id': info.get('id'),
+            'title': info.get('title'),
+            'url': info.get('url'),
+            'duration': info.get('duration'),
+            'thumbnail': info.get('thumbnail'),
+            'webpage_url': info.get('webpage_url'),
+        }
+        self.meta_cache.set(url, meta, expire=METADATA_CACHE_TTL)
+        return meta
+
+    def _progress_hook(self, d):
+        """
+        yt-dlp progress hook that captures the final filename of a download
+        (instead of diffing the temp dir, which races under concurrency)
+        """
+        if d.get('status') == 'finished':
+            self._download_result['path'] = d['filename']
+
+    def _download_sync(self, url):
+        """
+        Synchronous download function to run in thread pool
+        """
+        try:
+            # Reuse a previously downloaded file if it is still on disk
+            cached_path = self.meta_cache.get(f"file:{url}")
+            if cached_path and os.path.exists(cached_path):
+                logger.info("Using cached file for %s: %s", url, cached_path)
+                return cached_path
+
+            # Extract info first (cached across requests)
+            info = self._extract_info(url)
+
+            video_id = info.get('id', 'unknown')
+            title = info.get('title', 'Unknown')
+
+            logger.info("Downloading: %s (ID: %s)", title, video_id)
+
+            # The progress hook on the shared instance records the final
+            # filename; the lock keeps it paired with this download
+            with self._ytdl_lock:
+                self._download_result.clear()
+                self._ytdl.download([url])
+                filepath = self._download_result.get('path')
+
+            if not filepath:
+                # Fall back to the deterministic outtmpl path
+                for ext in ('m4a', 'webm', 'opus', 'mp3'):
+                    candidate = os.path.join(self.temp_dir, f"{video_id}.{ext}")
+                    if os.path.exists(candidate):
+                        filepath = candidate
+                        break
+
+            # No stat verification here: yt-dlp renames atomically from
+            # .part on success and raises DownloadError on failure, so a
+            # reported filepath is known-good
+            if not filepath:
+                raise Exception(f"Downloaded file not found for video ID: {video_id}")
+
+            logger.info("Found downloaded file: %s", filepath)
+            self.meta_cache.set(f"file:{url}", filepath, expire=METADATA_CACHE_TTL)
+            return filepath
+
+        except Exception as e:
+            logger.error("Sync download error: %s", e)
+            raise
+    
+    def _cache_file(self, url, filepath):
+        """
+        Insert a downloaded file into the LRU cache, evicting the oldest
+        entries once the size cap is exceeded
+        """
+        if url in self.file_cache:
+            self.file_cache.move_to_end(url)
+            return
+
+        try:
+            size = os.path.getsize(filepath)
+        except OSError:
+            size = 0
+
+        self.file_cache[url] = filepath
+        self.cache_bytes += size
+
+        while self.cache_bytes > self.cache_limit and len(self.file_cache) > 1:
+            _, old_path = self.file_cache.popitem(last=False)
+            try:
+                self.cache_bytes -= os.path.getsize(old_path)
+            except OSError:
+                pass
+            # Delay deletion in case the evicted file is still playing
+            self._schedule_cleanup(old_path)
+
+    def _schedule_cleanup(self, filepath):
+        """
+        Schedule a file for deletion after FILE_CLEANUP_DELAY seconds
+        """
+        heapq.heappush(self._cleanup_heap, (time.monotonic() + FILE_CLEANUP_DELAY, filepath))
+        self._cleanup_event.set()
+
+        # Lazily start the single cleanup task
+        if self._cleanup_task is None or self._cleanup_task.done():
+            self._cleanup_task = asyncio.create_task(self._cleanup_loop())
+
+    async def _cleanup_loop(self):
+        """
+        Long-lived task that deletes files once their deadline passes
+        """
+        while True:
+            if not self._cleanup_heap:
+                self._cleanup_event.clear()
+                await self._cleanup_event.wait()
+                continue
+
+            deadline, filepath = self._cleanup_heap[0]
+            now = time.monotonic()
+            if deadline > now:
+                # Sleep until the nearest deadline, waking early if a new
+                # (possibly earlier) entry is pushed
+                self._cleanup_event.clear()
+                try:
+                    await asyncio.wait_for(self._cleanup_event.wait(), timeout=deadline - now)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._cleanup_heap)
+            try:
+                if await asyncio.to_thread(os.path.exists, filepath):
+                    await asyncio.to_thread(os.remove, filepath)
+                    logger.info("Cleaned up temporary file: %s", filepath)
+            except Exception as e:
+                logger.error("Error cleaning up file %s: %s", filepath, e)
+
+    async def create_downloaded_source(self, url, volume=1.0):
+        """
+        Create an audio source by downloading the full file first
+
+        Args:
+            url: YouTube URL
+            volume: Audio volume (0.0 to 1.0)
+
+        Returns:
+            AudioSource: Discord audio source
+        """
+        try:
+            filepath = await self.download_audio(url)
+            if not filepath:
+                raise Exception("Failed to download audio")
+            
+            # The file stays on disk for reuse; the LRU cache owns its
+            # lifetime, so no per-playback cleanup is scheduled. Volume is
+            # handled inside ffmpeg, keeping the Opus pass-through at any
+            # volume instead of only at 1.0.
+            return DownloadedAudioSource(filepath, volume=volume)
+            
+        except Exception as e:
+            logger.error("Error creating audio source: %s", e)
+            raise
+    
+    def cleanup(self):
+        """
+        Clean up temporary directory and files
+
+        Must never touch yt-dlp's cachedir (config.YTDL_OPTIONS), which is
+        a persistent volume that survives restarts intentionally
+        """
+        try:
+            import shutil
+            self.executor.shutdown(wait=False)
+            self._ytdl.close()
+            self.meta_cache.close()
+            if os.path.exists(self.temp_dir):
+                shutil.rmtree(self.temp_dir)
+                logger.info("Cleaned up temp directory: %s", self.temp_dir)
+        except Exception as e:
+            logger.error("Error cleaning up temp directory: %s", e)
+
+@functools.cache
+def get_audio_downloader():
+    """
+    Lazily create the shared AudioDownloader instance
+
+    Instantiating at import time created a temp directory for every
+    importer (tests, reloads, tooling); deferring it means disk I/O only
+    happens once a download is actually requested. Cleanup is registered
+    for interpreter exit so the temp directory doesn't leak.
+    """
+    downloader = AudioDownloader()
+    atexit.register(downloader.cleanup)
+    return downloader
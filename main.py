@@ -1,51 +1,86 @@
-import os
-import discord
-from discord.ext import commands
-from config import TOKEN, COMMAND_PREFIX
-
-class MusicBot(commands.Bot):
-    def __init__(self):
-        intents = discord.Intents.default()
-        intents.message_content = True
-        intents.voice_states = True
-        
-        super().__init__(
-            command_prefix=COMMAND_PREFIX,
-            intents=intents,
-            activity=discord.Activity(
-                type=discord.ActivityType.listening,
-                name="/music | /play"
-            )
-        )
-
-    async def setup_hook(self):
-        """Load cogs when the bot starts"""
-        # Load improved music cog
-        try:
-            await self.load_extension('cogs.music_improved')
-            print("Improved music cog loaded!")
-        except Exception as e:
-            print(f"Failed to load music cog: {e}")
-            raise
-
-    async def on_ready(self):
-        """Called when the bot is ready"""
-        print(f'Logged in as {self.user.name} ({self.user.id})')
-        print('------')
-        
-        # Sync slash commands
-        print("Syncing slash commands...")
-        await self.tree.sync()
-        print("Slash commands synced!")
-
-def main():
-    """Main entry point for the bot"""
-    if not TOKEN:
-        print("Error: No Discord token found. Please set the DISCORD_TOKEN environment variable.")
-        return
-
-    bot = MusicBot()
-    bot.run(TOKEN)
-
-if __name__ == '__main__':
-    main()
+import os
+import logging
+import logging.handlers
+import queue
+import discord
+from discord.ext import commands
+from config import TOKEN, COMMAND_PREFIX
+from audio_downloader import get_audio_downloader
+
+def setup_logging():
+    """Route log records through a queue to a listener thread so handler
+    I/O never blocks the asyncio event loop"""
+    log_queue = queue.SimpleQueue()
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(
+        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    ))
+
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    listener.start()
+    return listener
+
+class MusicBot(commands.Bot):
+    def __init__(self):
+        intents = discord.Intents.default()
+        intents.message_content = True
+        intents.voice_states = True
+        
+        super().__init__(
+            command_prefix=COMMAND_PREFIX,
+            intents=intents,
+            activity=discord.Activity(
+                type=discord.ActivityType.listening,
+                name="/music | /play"
+            )
+        )
+
+    async def setup_hook(self):
+        """Load cogs when the bot starts"""
+        # Load improved music cog
+        try:
+            await self.load_extension('cogs.music_improved')
+            print("Improved music cog loaded!")
+        except Exception as e:
+            print(f"Failed to load music cog: {e}")
+            raise
+
+    async def close(self):
+        """Clean up the audio downloader's temp files on shutdown"""
+        # Only clean up if the downloader was ever created; calling it
+        # unconditionally would construct it (temp dir, executor, caches)
+        # just to tear it down
+        if get_audio_downloader.cache_info().currsize:
+            get_audio_downloader().cleanup()
+        await super().close()
+
+    async def on_ready(self):
+        """Called when the bot is ready"""
+        print(f'Logged in as {self.user.name} ({self.user.id})')
+        print('------')
+        
+        # Sync slash commands
+        print("Syncing slash commands...")
+        await self.tree.sync()
+        print("Slash commands synced!")
+
+def main():
+    """Main entry point for the bot"""
+    if not TOKEN:
+        print("Error: No Discord token found. Please set the DISCORD_TOKEN environment variable.")
+        return
+
+    listener = setup_logging()
+    try:
+        bot = MusicBot()
+        bot.run(TOKEN)
+    finally:
+        listener.stop()
+
+if __name__ == '__main__':
+    main()
@@ -1,102 +1,171 @@
-import asyncio
-import yt_dlp
-from concurrent.futures import ProcessPoolExecutor
-from config import YTDL_OPTIONS
-import time
-import threading
-import queue
-import logging
-
-logger = logging.getLogger(__name__)
-
-def extract_info_sync(query, options):
-    """Synchronous function to extract info using yt_dlp in a separate process"""
-    try:
-        with yt_dlp.YoutubeDL(options) as ytdl:
-            info = ytdl.extract_info(query, download=False)
-            if 'entries' in info:
-                info = info['entries'][0]
-            return info
-    except Exception as e:
-        logger.error(f"Error in process: {e}")
-        return None
-
-class YTDLSource:
-    def __init__(self, max_workers=2):  # Reduced workers to conserve resources
-        self.process_pool = ProcessPoolExecutor(max_workers=max_workers)
-        self.download_queue = queue.PriorityQueue()
-        self.url_cache = {}
-        self.cache_expiry = {}
-        self.cache_duration = 3600
-        self.download_in_progress = set()
-        self.download_lock = threading.Lock()
-        self.options = YTDL_OPTIONS.copy()
-
-    def get_cached_url(self, query):
-        if query in self.url_cache and time.time() < self.cache_expiry.get(query, 0):
-            logger.info(f"Using cached URL for {query}")
-            return self.url_cache[query]
-        return None
-
-    async def extract_info(self, query, download=False, priority=1):
-        with self.download_lock:
-            if query in self.download_in_progress:
-                logger.info(f"Waiting for {query} in progress...")
-                return None  # Simplified; could wait with a Future
-            self.download_in_progress.add(query)
-
-        try:
-            info = await asyncio.get_event_loop().run_in_executor(
-                self.process_pool,
-                extract_info_sync,
-                query,
-                self.options
-            )
-            if info and 'url' in info:
-                self.url_cache[query] = info['url']
-                self.cache_expiry[query] = time.time() + self.cache_duration
-            return info
-        finally:
-            with self.download_lock:
-                self.download_in_progress.discard(query)
-
-    async def search_song(self, search_query: str, priority=1):
-        try:
-            info = await self.extract_info(f"ytsearch1:{search_query}", False, priority)
-            if info:
-                return {
-                    'webpage_url': info['webpage_url'],
-                    'title': info['title'],
-                    'thumbnail': info.get('thumbnail'),
-                    'url': info.get('url')
-                }
-            return None
-        except Exception as e:
-            logger.error(f"Search error: {e}")
-            return None
-
-    async def get_audio_source(self, url: str, priority=1):
-        try:
-            cached_url = self.get_cached_url(url)
-            if cached_url:
-                return {'url': cached_url, 'title': 'Unknown', 'webpage_url': url}
-            info = await self.extract_info(url, False, priority)
-            if info:
-                return {
-                    'url': info.get('url'),
-                    'title': info.get('title', 'Unknown'),
-                    'thumbnail': info.get('thumbnail'),
-                    'webpage_url': info.get('webpage_url', url)
-                }
-            return None
-        except Exception as e:
-            logger.error(f"Audio source error: {e}")
-            return None
-
-    async def prefetch_song(self, url: str):
-        try:
-            await self.extract_info(url, False, priority=10)
-            return True
-        except Exception as e:
-            logger.error(f"Prefetch error: {e}")
+import asyncio
+import types
+import yt_dlp
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from config import YTDL_OPTIONS
+import time
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Read-only snapshot of the config options. Every instance used to copy
+# the dict even though it was never mutated; a MappingProxyType makes any
+# accidental write an immediate TypeError instead of silent drift.
+_YTDL_OPTIONS = types.MappingProxyType(dict(YTDL_OPTIONS))
+
+class YTDLSource:
+    def __init__(self, max_workers=2):  # Reduced workers to conserve resources
+        # yt_dlp is network-bound and releases the GIL during socket I/O,
+        # so threads beat processes here: no per-call pickling of options,
+        # no interpreter per worker
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ytdl")
+        # Bounded LRU of query -> (url, expiry); the old parallel dicts
+        # grew without bound and never freed expired entries
+        self._cache = OrderedDict()
+        self._cache_max = 512
+        self.cache_duration = 3600
+        # Companion metadata (title/thumbnail/webpage_url) keyed like
+        # _cache so repeated searches skip extraction entirely; entries
+        # live and die with their _cache counterpart
+        self._meta_cache = {}
+        # In-flight fetches keyed by query: concurrent callers for the same
+        # query share one Future instead of doing redundant network work
+        self._inflight = {}
+        self._inflight_lock = asyncio.Lock()
+
+        # One YoutubeDL for this source's lifetime; constructing it per call
+        # re-initializes every extractor. It is not thread-safe, so calls
+        # are serialized by a lock. yt_dlp mutates its params dict, so hand
+        # it a throwaway copy of the shared read-only options.
+        self._ytdl = yt_dlp.YoutubeDL(dict(_YTDL_OPTIONS))
+        # Deliberately a threading.Lock, not asyncio.Lock: it is only ever
+        # taken inside executor worker threads (_extract_info_sync), where
+        # blocking the thread is correct and an asyncio.Lock would not be
+        # usable. Coroutine-side coordination uses _inflight_lock above.
+        self._ytdl_lock = threading.Lock()
+
+    def _extract_info_sync(self, query):
+        """Synchronous extraction on the shared instance, run in a worker thread"""
+        try:
+            with self._ytdl_lock:
+                info = self._ytdl.extract_info(query, download=False)
+            if info and 'entries' in info:
+                info = info['entries'][0]
+            return info
+        except Exception as e:
+            logger.error("Error extracting info: %s", e)
+            return None
+
+    def get_cached_url(self, query):
+        entry = self._cache.get(query)
+        if entry:
+            url, expiry = entry
+            if time.time() < expiry:
+                self._cache.move_to_end(query)
+                logger.info("Using cached URL for %s", query)
+                return url
+            # Lazily drop the expired entry and its metadata
+            self._cache.pop(query, None)
+            self._meta_cache.pop(query, None)
+        return None
+
+    async def extract_info(self, query, download=False):
+        loop = asyncio.get_event_loop()
+
+        async with self._inflight_lock:
+            future = self._inflight.get(query)
+            if future is None:
+                future = loop.create_future()
+                self._inflight[query] = future
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            logger.info("Waiting for in-flight fetch of %s...", query)
+            return await future
+
+        try:
+            info = await loop.run_in_executor(
+                self.executor,
+                self._extract_info_sync,
+                query
+            )
+            if info and 'url' in info:
+                self._cache[query] = (info['url'], time.time() + self.cache_duration)
+                self._cache.move_to_end(query)
+                self._meta_cache[query] = {
+                    'title': info.get('title', 'Unknown'),
+                    'thumbnail': info.get('thumbnail'),
+                    'webpage_url': info.get('webpage_url', query)
+                }
+                while len(self._cache) > self._cache_max:
+                    evicted, _ = self._cache.popitem(last=False)
+                    self._meta_cache.pop(evicted, None)
+            future.set_result(info)
+            return info
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            # CancelledError is a BaseException, so the except clause above
+            # doesn't resolve the future when the owner task is cancelled.
+            # Cancel it here so waiters don't hang on a future that will
+            # never complete after the entry is dropped from _inflight.
+            if not future.done():
+                future.cancel()
+            async with self._inflight_lock:
+                self._inflight.pop(query, None)
+
+    async def search_song(self, search_query: str):
+        try:
+            query = f"ytsearch1:{search_query}"
+
+            # A repeated search can be answered from the caches without
+            # touching the network at all
+            cached_url = self.get_cached_url(query)
+            if cached_url:
+                meta = self._meta_cache.get(query)
+                if meta:
+                    return {**meta, 'url': cached_url}
+
+            info = await self.extract_info(query, False)
+            if info:
+                return {
+                    'webpage_url': info['webpage_url'],
+                    'title': info['title'],
+                    'thumbnail': info.get('thumbnail'),
+                    'url': info.get('url')
+                }
+            return None
+        except Exception as e:
+            logger.error("Search error: %s", e)
+            return None
+
+    async def get_audio_source(self, url: str):
+        try:
+            cached_url = self.get_cached_url(url)
+            if cached_url:
+                return {'url': cached_url, 'title': 'Unknown', 'webpage_url': url}
+            info = await self.extract_info(url, False)
+            if info:
+                return {
+                    'url': info.get('url'),
+                    'title': info.get('title', 'Unknown'),
+                    'thumbnail': info.get('thumbnail'),
+                    'webpage_url': info.get('webpage_url', url)
+                }
+            return None
+        except Exception as e:
+            logger.error("Audio source error: %s", e)
+            return None
+
+    async def prefetch_song(self, url: str):
+        try:
+            await self.extract_info(url, False)
+            return True
+        except Exception as e:
+            logger.error("Prefetch error: %s", e)
             return False
\ No newline at end of file